@@ -1,25 +1,85 @@
 import os
 import sys
 import json
-import requests
+import asyncio
 import argparse
 import quip
 import time
-import re
+import contextlib
+import functools
+import uuid
+import atexit
+import logging
+import logging.handlers
+from queue import SimpleQueue
 from urllib.parse import urlparse
 
+import aiofiles
+import aiohttp
+
+try:
+    # orjson parses Quip's JSON responses several times faster when available
+    from orjson import loads as json_loads
+except ImportError:
+    from json import loads as json_loads
+
+
+logger = logging.getLogger(__name__)
+
+# Size of each read from a streamed HTTP response
+CHUNK_SIZE = 65536
+# Buffer size for files being written from a stream
+WRITE_BUFFER_SIZE = 1 << 20
+# Default ceiling on the number of Quip requests in flight at once
+MAX_CONCURRENCY = 16
+# Seconds allowed to open a connection, and to wait between reads of a response;
+# there is no overall limit because large exports can take a long time
+CONNECT_TIMEOUT = 30
+READ_TIMEOUT = 300
+# Requests allowed in flight before any have succeeded
+INITIAL_CONCURRENCY = 4
+# Quip's default per-user quota is 50 API requests per minute
+RATE_LIMIT_PER_MINUTE = 50
+# How many times a rate-limited or transiently failing request is retried
+MAX_RETRIES = 5
+# Number of IDs sent per bulk folder/thread request
+BATCH_SIZE = 50
+# Document formats written when --formats is not given
+DEFAULT_FORMATS = frozenset(['docx'])
+# Number of workers draining the folder queue
+FOLDER_WORKERS = 4
+# Statuses worth retrying: rate limiting and gateway errors
+RETRY_STATUSES = frozenset([429, 502, 503, 504])
+
+# Characters that are not allowed in file names, mapped for deletion
+_SANITIZE_TABLE = str.maketrans('', '', '\\/*?:"<>|')
+
+
+def configure_logging(level=logging.INFO):
+    """Log progress to stdout from a background thread.
+
+    Tasks only enqueue their records, so concurrent downloads never wait on
+    each other to write to the console.
+    """
+    log_queue = SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, logging.StreamHandler(sys.stdout))
+    logging.basicConfig(level=level, format='%(message)s',
+                        handlers=[logging.handlers.QueueHandler(log_queue)])
+    listener.start()
+    atexit.register(listener.stop)
+
 
 def sanitize_filename(filename):
     """Remove invalid characters from a filename."""
-    return re.sub(r'[\\/*?:"<>|]', '', filename)
+    return filename.translate(_SANITIZE_TABLE)
 
 
 def create_directory_if_not_exists(path):
     """Create a directory if it doesn't exist."""
-    if not os.path.exists(path):
-        os.makedirs(path)
+    os.makedirs(path, exist_ok=True)
 
 
+@functools.lru_cache(maxsize=1024)
 def extract_id_from_link(link):
     """Extract the folder ID from a Quip link."""
     # Handle different Quip URL formats
@@ -41,137 +101,495 @@ def extract_id_from_link(link):
     return potential_id
 
 
+@functools.lru_cache(maxsize=1024)
 def get_domain_from_link(link):
     """Extract the domain from a Quip link to determine the API base URL."""
     parsed_url = urlparse(link)
     return parsed_url.netloc
 
 
-def download_blob(url, file_path):
+def read_export_meta(meta_path):
+    """Load the record left by a previous export of a document, if any."""
+    try:
+        with open(meta_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def write_export_meta(meta_path, meta):
+    """Record what was exported for a document so later runs can skip it."""
+    with open(meta_path, 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+
+
+def make_unique_names(names):
+    """Suffix repeated file names with (2), (3), ... so each is distinct."""
+    seen = set()
+    unique = []
+    for name in names:
+        base, ext = os.path.splitext(name)
+        candidate = name
+        count = 1
+        # Compare case-insensitively so names also differ on macOS and Windows
+        while candidate.casefold() in seen:
+            count += 1
+            candidate = f"{base} ({count}){ext}"
+        seen.add(candidate.casefold())
+        unique.append(candidate)
+    return unique
+
+
+def get_thread_title(thread_data):
+    """Return the file name for a document, derived from its title."""
+    return sanitize_filename(thread_data.get('thread', {}).get('title', 'Unknown_Document'))
+
+
+def claim_output_path(claimed, kind, path, owner):
+    """Reserve `path` for `owner` for the rest of the run.
+
+    `claimed` is shared by every worker of an export. If another folder or
+    document of the same `kind` already holds the path, ` (owner)` is
+    appended; the Quip ID keeps the name stable across runs for resuming.
+    """
+    # Compare case-insensitively so names also differ on macOS and Windows
+    if claimed.setdefault((kind, path.casefold()), owner) != owner:
+        path = f"{path} ({owner})"
+        claimed.setdefault((kind, path.casefold()), owner)
+    return path
+
+
+def assign_thread_titles(documents, threads, claimed):
+    """Map each (thread_id, path) document to a file name no other document uses."""
+    titles = {}
+    for thread_id, current_path in documents:
+        title = get_thread_title(threads.get(thread_id) or {})
+        path = claim_output_path(claimed, 'document', os.path.join(current_path, title), thread_id)
+        titles[(thread_id, current_path)] = os.path.basename(path)
+    return titles
+
+
+def get_blob_key(blob):
+    """Identify an attachment's content by its hash, or by name, size and blob ID."""
+    if blob.get('hash'):
+        return blob['hash']
+    # A replaced attachment keeps its name but gets a new blob, so the ID (or
+    # the URL that contains it) tells the versions apart when size is missing
+    return f"{blob.get('name')}:{blob.get('size')}:{blob.get('id') or blob.get('url')}"
+
+
+async def stream_to_file(response, file_path):
+    """Write a streamed response body to a file in fixed-size chunks."""
+    # Write to a temporary name so an interrupted download never looks complete;
+    # the random part keeps concurrent downloads to one path from sharing it
+    partial_path = f"{file_path}.{uuid.uuid4().hex[:8]}.part"
+    try:
+        async with aiofiles.open(partial_path, 'wb', buffering=WRITE_BUFFER_SIZE) as f:
+            async for chunk in response.content.iter_chunked(CHUNK_SIZE):
+                await f.write(chunk)
+        os.replace(partial_path, file_path)
+    except BaseException:
+        # Also covers cancellation and Ctrl+C, which should not leave debris behind
+        with contextlib.suppress(OSError):
+            os.remove(partial_path)
+        raise
+
+
+async def download_blob(fetcher, url, file_path):
     """Download an attachment to a file."""
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        with open(file_path, 'wb') as f:
-            f.write(response.content)
+        async with fetcher.get(url) as response:
+            response.raise_for_status()
+            await stream_to_file(response, file_path)
         return True
     except Exception as e:
-        print(f"Error downloading attachment: {e}")
+        logger.error("Error downloading attachment: %s", e)
         return False
 
 
-def process_thread(client, thread_id, current_path):
-    """Process a document thread to extract content and attachments."""
+def parse_retry_after(value, default):
+    """Return the delay in seconds requested by a Retry-After header."""
+    try:
+        return max(float(value), default)
+    except (TypeError, ValueError):
+        return default
+
+
+class LeakyBucket(object):
+    """Token bucket that lets requests through at a sustained rate."""
+
+    def __init__(self, capacity, refill_per_sec):
+        self.capacity = capacity
+        self.refill_per_sec = refill_per_sec
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        """Take one token, sleeping only while the bucket is empty."""
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity,
+                                  self.tokens + (now - self.updated) * self.refill_per_sec)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.refill_per_sec)
+
+
+class AdaptiveLimiter(object):
+    """Concurrency limit tuned by additive increase, multiplicative decrease.
+
+    Each successful request raises the limit by 1/limit, so it grows by about
+    one per round of requests. A 429 halves it, but only once per window: 429s
+    from requests that started before the last decrease are ignored, so a
+    burst of rejections from one round counts as a single signal.
+
+    Entering the limiter returns a token identifying the current window, to
+    be passed back to `decrease`.
+    """
+
+    def __init__(self, max_limit, initial_limit=INITIAL_CONCURRENCY):
+        self.max_limit = max_limit
+        self.limit = min(initial_limit, max_limit)
+        self.in_flight = 0
+        self.window = 0
+        self.condition = asyncio.Condition()
+
+    async def __aenter__(self):
+        async with self.condition:
+            await self.condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+            return self.window
+
+    async def __aexit__(self, *exc_info):
+        async with self.condition:
+            self.in_flight -= 1
+            self.condition.notify_all()
+
+    def increase(self):
+        """Additively raise the limit after a successful request."""
+        self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def decrease(self, window):
+        """Halve the limit after Quip rejected a request started in `window`."""
+        if window != self.window:
+            return
+        self.window += 1
+        self.limit = max(1, self.limit // 2)
+
+
+class QuipFetcher(object):
+    """Runs Quip API calls and downloads concurrently over one aiohttp session.
+
+    The session is expected to carry the Authorization header, so every
+    request shares its keep-alive connection pool.
+    """
+
+    def __init__(self, client, session, max_concurrency=MAX_CONCURRENCY,
+                 rate_limit=RATE_LIMIT_PER_MINUTE):
+        self.client = client
+        self.session = session
+        # Built once rather than per request
+        self.api_url = f"{client.base_url}/1/"
+        self.export_url_template = self.api_url + "threads/{}/export/docx"
+        self.limiter = AdaptiveLimiter(max_concurrency)
+        self.bucket = LeakyBucket(rate_limit, rate_limit / 60.0)
+
+    async def get_folders(self, ids):
+        """Returns a dictionary of folders for the given IDs."""
+        return await self._get_batched("folders/", ids)
+
+    async def get_threads(self, ids):
+        """Returns a dictionary of threads for the given IDs."""
+        return await self._get_batched("threads/", ids)
+
+    async def get_json(self, path, **params):
+        """Fetch a Quip API endpoint over the pooled session and decode it."""
+        async with self.get(self.api_url + path, params=params) as response:
+            if response.status >= 400:
+                try:
+                    # Extract the developer-friendly error message from the response
+                    message = json_loads(await response.read())["error_description"]
+                except Exception:
+                    response.raise_for_status()
+                raise quip.QuipError(response.status, message, None)
+            return json_loads(await response.read())
+
+    async def _get_batched(self, path, ids):
+        # Quip's bulk endpoints take a comma-separated list of IDs
+        batches = [ids[i:i + BATCH_SIZE] for i in range(0, len(ids), BATCH_SIZE)]
+        results = {}
+        for batch in await asyncio.gather(*[self._get_batch(path, batch) for batch in batches]):
+            results.update(batch)
+        return results
+
+    async def _get_batch(self, path, ids):
+        # One inaccessible ID fails the whole request, so split a failed batch
+        # in half until only the IDs that really fail are left out
+        try:
+            return await self.get_json(path, ids=",".join(ids))
+        except Exception as e:
+            if len(ids) == 1:
+                logger.error("Error accessing %s%s: %s", path, ids[0], e)
+                return {}
+        middle = len(ids) // 2
+        results = {}
+        for half in await asyncio.gather(self._get_batch(path, ids[:middle]),
+                                         self._get_batch(path, ids[middle:])):
+            results.update(half)
+        return results
+
+    @contextlib.asynccontextmanager
+    async def get(self, url, **kwargs):
+        """Yield the response to a GET, backing off on 429 and gateway errors."""
+        delay = 1
+        for attempt in range(MAX_RETRIES + 1):
+            await self.bucket.acquire()
+            async with self.limiter as window:
+                async with self.session.get(url, **kwargs) as response:
+                    if response.status == 429:
+                        self.limiter.decrease(window)
+                    elif 200 <= response.status < 300:
+                        self.limiter.increase()
+                    if response.status not in RETRY_STATUSES or attempt == MAX_RETRIES:
+                        yield response
+                        return
+                    status = response.status
+                    retry_after = parse_retry_after(response.headers.get('Retry-After'), delay)
+            logger.warning("Quip returned %d, retrying in %.0fs", status, retry_after)
+            await asyncio.sleep(retry_after)
+            delay *= 2
+
+
+async def process_thread_async(fetcher, thread_id, thread_data, current_path, formats=DEFAULT_FORMATS,
+                               thread_title=None):
+    """Process a document thread to extract content and attachments.
+
+    `thread_title` overrides the file name derived from the thread's title.
+    """
     try:
-        thread_data = client.get_thread(thread_id)
+        if not thread_data:
+            logger.error("Error accessing document %s: not returned by Quip", thread_id)
+            return
         
         if 'error' in thread_data:
-            print(f"Error accessing document {thread_id}: {thread_data['error']}")
+            logger.error("Error accessing document %s: %s", thread_id, thread_data['error'])
             return
         
-        thread_title = thread_data.get('thread', {}).get('title', 'Unknown_Document')
-        thread_title = sanitize_filename(thread_title)
+        if thread_title is None:
+            thread_title = get_thread_title(thread_data)
         
-        # Construct the export URL for DOCX format
-        export_url = f"{client.base_url}/1/threads/{thread_id}/export/docx"
-        headers = {"Authorization": f"Bearer {client.access_token}"}
+        # Documents exported by an earlier run are skipped until they change
+        meta_path = os.path.join(current_path, f".{thread_id}.meta")
+        previous_meta = read_export_meta(meta_path)
+        updated_usec = thread_data.get('thread', {}).get('updated_usec')
+        unchanged = updated_usec is not None and previous_meta.get('updated_usec') == updated_usec
+        meta = {'updated_usec': None, 'blobs': {}}
         
-        # Download the DOCX file
         docx_path = os.path.join(current_path, f"{thread_title}.docx")
-        response = requests.get(export_url, headers=headers)
+        docx_unchanged = 'docx' in formats and unchanged and os.path.exists(docx_path)
         
-        if response.status_code == 200:
-            with open(docx_path, 'wb') as file:
-                file.write(response.content)
-            print(f"Extracted DOCX: {docx_path}")
-        else:
-            print(f"Failed to download DOCX for {thread_title}: {response.status_code}")
+        # The HTML arrived with the thread metadata, so save it before the slower DOCX export;
+        # it is not needed as a fallback when the DOCX from an earlier run is still current
+        html_path = os.path.join(current_path, f"{thread_title}.html")
+        content = thread_data.get('html')
+        html_written = bool(content) and ('html' in formats or not docx_unchanged)
+        if html_written:
+            with open(html_path, 'w', encoding='utf-8') as file:
+                file.write(content)
+            if 'html' in formats:
+                logger.info("Extracted HTML: %s", html_path)
+        
+        # Only the attachment list is needed from here on, so let the HTML be
+        # freed while the slower downloads run
+        blobs = thread_data.get('blobs', [])
+        content = thread_data = None
+        
+        docx_exported = False
+        if 'docx' in formats:
+            # Construct the export URL for DOCX format
+            export_url = fetcher.export_url_template.format(thread_id)
+            
+            # Download the DOCX file
+            if docx_unchanged:
+                docx_exported = True
+                meta['updated_usec'] = updated_usec
+                logger.info("Skipping unchanged DOCX: %s", docx_path)
+            else:
+                async with fetcher.get(export_url) as response:
+                    status = response.status
+                    if status == 200:
+                        await stream_to_file(response, docx_path)
+                
+                if status == 200:
+                    docx_exported = True
+                    meta['updated_usec'] = updated_usec
+                    logger.info("Extracted DOCX: %s", docx_path)
+                else:
+                    logger.warning("Failed to download DOCX for %s: %s", thread_title, status)
+                    if html_written and 'html' not in formats:
+                        logger.info("Extracted HTML instead: %s", html_path)
             
-            # Fallback to HTML if DOCX export fails
-            html_path = os.path.join(current_path, f"{thread_title}.html")
-            content = thread_data.get('html')
-            if content:
-                with open(html_path, 'w', encoding='utf-8') as file:
-                    file.write(content)
-                print(f"Extracted HTML instead: {html_path}")
+            # The HTML was only a fallback unless it was asked for
+            if html_written and 'html' not in formats and docx_exported:
+                os.remove(html_path)
         # Download attachments if any
-        blobs = thread_data.get('blobs', [])
         if blobs:
             # Create attachments folder
             attachments_path = os.path.join(current_path, f"{thread_title}_attachments")
             create_directory_if_not_exists(attachments_path)
+            attachments_prefix = attachments_path + os.sep
+            previous_blobs = previous_meta.get('blobs', {})
+            
+            # Attachments with the same name would otherwise overwrite each other
+            blob_names = make_unique_names(
+                [sanitize_filename(blob.get('name', 'Unknown_Attachment')) for blob in blobs])
             
-            for blob in blobs:
+            async def process_blob(blob, blob_name):
                 blob_url = blob.get('url')
-                blob_name = blob.get('name', 'Unknown_Attachment')
-                blob_name = sanitize_filename(blob_name)
-                blob_path = os.path.join(attachments_path, blob_name)
+                blob_path = attachments_prefix + blob_name
+                blob_key = get_blob_key(blob)
                 
-                if blob_url and download_blob(blob_url, blob_path):
-                    print(f"Downloaded attachment: {blob_path}")
+                if previous_blobs.get(blob_name) == blob_key and os.path.exists(blob_path):
+                    meta['blobs'][blob_name] = blob_key
+                elif blob_url and await download_blob(fetcher, blob_url, blob_path):
+                    meta['blobs'][blob_name] = blob_key
+                    logger.info("Downloaded attachment: %s", blob_path)
+            
+            # Attachments are independent, so download them all at once
+            await asyncio.gather(*[process_blob(blob, blob_name)
+                                   for blob, blob_name in zip(blobs, blob_names)])
+        
+        write_export_meta(meta_path, meta)
     
     except Exception as e:
-        print(f"Error processing document {thread_id}: {e}")
+        logger.error("Error processing document %s: %s", thread_id, e)
 
 
-def process_folder(client, folder_id, base_path='.', depth=0):
-    """Recursively process a Quip folder, extracting all files with hierarchical paths."""
+async def process_folder_batch(fetcher, jobs, enqueue, formats=DEFAULT_FORMATS, claimed=None):
+    """Process a batch of (folder_id, base_path, depth) jobs.
+
+    Subfolder jobs are handed to `enqueue` as soon as they are discovered,
+    before this batch's documents are downloaded. `claimed` holds the output
+    paths already taken this run (see `claim_output_path`).
+    """
+    if claimed is None:
+        claimed = {}
+    documents = []
+    completed = []
+    
     try:
+        folders = await fetcher.get_folders([job[0] for job in jobs])
+    except Exception as e:
+        logger.error("Error accessing folders %s: %s", ', '.join(job[0] for job in jobs), e)
+        return
+    
+    for folder_id, base_path, depth in jobs:
         # Add indentation for better visual hierarchy in the console output
         indent = "  " * depth
-        
-        folder = client.get_folder(folder_id)
-        
+        folder = folders.get(folder_id)
+        if not folder:
+            logger.error("%sError accessing folder %s: not returned by Quip", indent, folder_id)
+            continue
         if 'error' in folder:
-            print(f"{indent}Error accessing folder {folder_id}: {folder['error']}")
-            return
-        print(f"DEBUG - Folder structure: {json.dumps(folder, indent=2)[:200]}...")
+            logger.error("%sError accessing folder %s: %s", indent, folder_id, folder['error'])
+            continue
+        logger.debug("%sFolder %s keys: %s", indent, folder_id, list(folder))
         folder_title = folder.get('folder', {}).get('title', 'Unknown_Folder')
         folder_title = sanitize_filename(folder_title)
         
-        # Create a directory for the folder
-        current_path = os.path.join(base_path, folder_title)
+        # Create a directory for the folder; same-titled siblings get their own
+        current_path = claim_output_path(claimed, 'folder', os.path.join(base_path, folder_title), folder_id)
         create_directory_if_not_exists(current_path)
-        print(f"{indent}Processing folder: {folder_title}")
+        logger.info("%sProcessing folder: %s", indent, folder_title)
         
         # Process all children in the folder
         children = folder.get('children', [])
-
-        # Try different paths to find children
-        children = []
-        if 'children' in folder:
-            children = folder['children']
-        # elif 'folder' in folder and 'children' in folder['folder']:
-        #     children = folder['folder']['children']
-        # elif 'threads' in folder:
-        #     children = folder['threads']
         
         # Count items for progress tracking
         total_items = len(children)
-        print(f"Found in {folder_title}: ({total_items} items)")
-        
-        # Count items for progress tracking
-        processed_items = 0
+        logger.info("Found in %s: (%d items)", folder_title, total_items)
+        completed.append((indent, folder_title, total_items))
         
         for child in children:
-            processed_items += 1
-            
             # Determine type based on which ID is present
             if 'thread_id' in child:
-                # Process documents
-                print(f"{indent}  ({processed_items}/{total_items}) Processing document...")
-                process_thread(client, child['thread_id'], current_path)
+                documents.append((child['thread_id'], current_path))
             elif 'folder_id' in child:
-                # Recursively process subfolders
-                process_folder(client, child['folder_id'], current_path, depth + 1)
-            
-            # Avoid hitting rate limits
-            time.sleep(0.5)
-            
-        print(f"{indent}Completed folder: {folder_title} ({total_items} items)")
+                enqueue((child['folder_id'], current_path, depth + 1))
     
-    except Exception as e:
-        print(f"Error processing folder {folder_id}: {e}")
+    if documents:
+        # Fetch every document's metadata up front, then download bodies in parallel
+        try:
+            threads = await fetcher.get_threads(list({thread_id for thread_id, _ in documents}))
+        except Exception as e:
+            logger.error("Error accessing documents: %s", e)
+            return
+        
+        # Documents sharing a title and directory would otherwise write the same files
+        documents = list(dict.fromkeys(documents))
+        titles = assign_thread_titles(documents, threads, claimed)
+        
+        logger.info("Processing %d documents...", len(documents))
+        tasks = [process_thread_async(fetcher, thread_id, threads.get(thread_id), current_path,
+                                      formats, titles[(thread_id, current_path)])
+                 for thread_id, current_path in documents]
+        # Each task drops its document's HTML once written; holding the whole
+        # batch's thread data here would keep it all alive until the last download
+        del threads
+        await asyncio.gather(*tasks)
+    
+    for indent, folder_title, total_items in completed:
+        logger.info("%sCompleted folder: %s (%d items)", indent, folder_title, total_items)
+
+
+async def folder_worker(fetcher, queue, workers, formats=DEFAULT_FORMATS, claimed=None):
+    """Drain folder jobs from the queue in batches, queueing any subfolders found."""
+    while True:
+        jobs = [await queue.get()]
+        # Take a fair share of the waiting folders so other workers stay busy
+        batch_size = min(BATCH_SIZE, 1 + queue.qsize() // workers)
+        while len(jobs) < batch_size and not queue.empty():
+            jobs.append(queue.get_nowait())
+        try:
+            await process_folder_batch(fetcher, jobs, queue.put_nowait, formats, claimed)
+        except Exception as e:
+            logger.error("Error processing folders: %s", e)
+        finally:
+            for _ in jobs:
+                queue.task_done()
+
+
+async def process_folder_async(fetcher, folder_id, base_path='.', workers=FOLDER_WORKERS,
+                               formats=DEFAULT_FORMATS):
+    """Process a Quip folder tree with a pool of workers sharing a folder queue."""
+    queue = asyncio.Queue()
+    queue.put_nowait((folder_id, base_path, 0))
+    # Output paths are claimed across all workers, since folders and documents
+    # that end up in the same directory may be handled by different batches
+    claimed = {}
+    tasks = [asyncio.ensure_future(folder_worker(fetcher, queue, workers, formats, claimed))
+             for _ in range(workers)]
+    try:
+        await queue.join()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def export_folder(client, folder_id, base_path, rate_limit=RATE_LIMIT_PER_MINUTE,
+                        formats=DEFAULT_FORMATS, max_concurrency=MAX_CONCURRENCY):
+    """Export a folder tree using a single pooled HTTP session."""
+    connector = aiohttp.TCPConnector(limit=max_concurrency)
+    headers = {"Authorization": f"Bearer {client.access_token}"}
+    timeout = aiohttp.ClientTimeout(total=None, sock_connect=CONNECT_TIMEOUT, sock_read=READ_TIMEOUT)
+    async with aiohttp.ClientSession(connector=connector, headers=headers, timeout=timeout) as session:
+        fetcher = QuipFetcher(client, session, max_concurrency, rate_limit)
+        await process_folder_async(fetcher, folder_id, base_path, formats=formats)
 
 
 def main():
@@ -181,8 +599,30 @@ def main():
     parser.add_argument('--output', '-o', default='./quip_export', help='Output directory (default: ./quip_export)')
     parser.add_argument('--token-file', dest='token_file', help='Path to file containing your Quip access token')
     parser.add_argument('--api-url', dest='api_url', help='Custom Quip API URL (default: https://platform.quip-amazon.com)')
+    parser.add_argument('--formats', dest='formats', default='docx',
+                        help='Comma-separated document formats to keep: docx, html (default: docx, '
+                             'with HTML kept only when the DOCX export fails)')
+    parser.add_argument('--rate-limit', dest='rate_limit', type=int, default=RATE_LIMIT_PER_MINUTE,
+                        help=f'Maximum Quip API requests per minute (default: {RATE_LIMIT_PER_MINUTE})')
+    parser.add_argument('--max-concurrency', dest='max_concurrency', type=int, default=MAX_CONCURRENCY,
+                        help=f'Maximum Quip requests in flight at once (default: {MAX_CONCURRENCY})')
+    parser.add_argument('--verbose', '-v', action='store_true', help='Log debugging details')
     
     args = parser.parse_args()
+    configure_logging(logging.DEBUG if args.verbose else logging.INFO)
+    
+    formats = frozenset(f.strip().lower() for f in args.formats.split(',') if f.strip())
+    if not formats or not formats <= {'docx', 'html'}:
+        logger.error("Invalid --formats value: %s (expected docx, html or docx,html)", args.formats)
+        sys.exit(1)
+    
+    if args.rate_limit < 1:
+        logger.error("--rate-limit must be at least 1")
+        sys.exit(1)
+    
+    if args.max_concurrency < 1:
+        logger.error("--max-concurrency must be at least 1")
+        sys.exit(1)
     
     # Get access token from file if specified
     if args.token_file:
@@ -190,7 +630,7 @@ def main():
             with open(args.token_file, 'r') as f:
                 args.access_token = f.read().strip()
         except Exception as e:
-            print(f"Error reading token file: {e}")
+            logger.error("Error reading token file: %s", e)
             sys.exit(1)
     
     # Prompt for access token if not provided
@@ -213,34 +653,35 @@ def main():
     try:
         client = quip.QuipClient(access_token=args.access_token, base_url=args.api_url)
     except Exception as e:
-        print(f"Failed to initialize Quip client: {e}")
-        print("\nTips for getting a valid access token:")
-        print("1. Go to https://quip-amazon.com/dev/token")
-        print("2. Click 'Generate Personal Access Token'")
-        print("3. Copy the token")
-        print("4. Make sure you have the correct permissions")
+        logger.error("Failed to initialize Quip client: %s", e)
+        logger.error("\nTips for getting a valid access token:")
+        logger.error("1. Go to https://quip-amazon.com/dev/token")
+        logger.error("2. Click 'Generate Personal Access Token'")
+        logger.error("3. Copy the token")
+        logger.error("4. Make sure you have the correct permissions")
         sys.exit(1)
     
     # Extract ID from link
     folder_id = extract_id_from_link(args.folder_link)
     if not folder_id:
-        print("Failed to extract folder ID from the provided link.")
-        print(f"The link provided was: {args.folder_link}")
-        print("Please make sure you're using a valid Quip folder link.")
+        logger.error("Failed to extract folder ID from the provided link.")
+        logger.error("The link provided was: %s", args.folder_link)
+        logger.error("Please make sure you're using a valid Quip folder link.")
         sys.exit(1)
     
     # Start processing
-    print(f"Starting extraction from folder ID: {folder_id}")
-    print(f"Files will be saved to: {os.path.abspath(args.output)}")
+    logger.info("Starting extraction from folder ID: %s", folder_id)
+    logger.info("Files will be saved to: %s", os.path.abspath(args.output))
     create_directory_if_not_exists(args.output)
     
     try:
-        process_folder(client, folder_id, args.output)
-        print("\nExtraction completed successfully!")
+        asyncio.run(export_folder(client, folder_id, args.output, args.rate_limit, formats,
+                                 args.max_concurrency))
+        logger.info("\nExtraction completed successfully!")
     except KeyboardInterrupt:
-        print("\n\nExtraction was interrupted by user. Partial data may have been extracted.")
+        logger.warning("\n\nExtraction was interrupted by user. Partial data may have been extracted.")
     except Exception as e:
-        print(f"\nExtraction failed: {e}")
+        logger.error("\nExtraction failed: %s", e)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,397 @@
+import asyncio
+import contextlib
+import json
+import os
+
+import pytest
+
+import quip_export
+
+
+class FakeContent(object):
+    def __init__(self, body):
+        self.body = body
+
+    async def iter_chunked(self, size):
+        for i in range(0, len(self.body), size):
+            yield self.body[i:i + size]
+
+
+class FakeResponse(object):
+    def __init__(self, status, body=b'', headers=None):
+        self.status = status
+        self.content = FakeContent(body)
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status >= 400:
+            raise RuntimeError(f"HTTP {self.status}")
+
+
+class FakeFetcher(object):
+    """Stands in for QuipFetcher, answering every GET with a fixed status."""
+
+    export_url_template = "https://platform.quip.test/1/threads/{}/export/docx"
+
+    def __init__(self, status=200):
+        self.status = status
+        self.requests = []
+
+    @contextlib.asynccontextmanager
+    async def get(self, url, **kwargs):
+        self.requests.append(url)
+        yield FakeResponse(self.status, b"body of " + url.encode())
+
+
+def make_thread(updated_usec=1, blob_hash='h1'):
+    return {
+        'thread': {'title': 'Doc', 'updated_usec': updated_usec},
+        'html': '<p>Doc</p>',
+        'blobs': [{'url': 'https://platform.quip.test/blob/1', 'name': 'a.png', 'hash': blob_hash}],
+    }
+
+
+def export(fetcher, thread_data, path):
+    asyncio.run(quip_export.process_thread_async(fetcher, 't1', thread_data, str(path)))
+    return fetcher.requests
+
+
+def test_first_export_downloads_and_records_meta(tmp_path):
+    requests = export(FakeFetcher(), make_thread(), tmp_path)
+
+    assert len(requests) == 2
+    assert (tmp_path / 'Doc.docx').exists()
+    assert (tmp_path / 'Doc_attachments' / 'a.png').exists()
+    # The HTML is only a fallback with the default formats
+    assert not (tmp_path / 'Doc.html').exists()
+    meta = json.loads((tmp_path / '.t1.meta').read_text())
+    assert meta == {'updated_usec': 1, 'blobs': {'a.png': 'h1'}}
+
+
+def test_unchanged_document_is_skipped_without_io(tmp_path):
+    export(FakeFetcher(), make_thread(), tmp_path)
+    docx_mtime = os.stat(tmp_path / 'Doc.docx').st_mtime_ns
+
+    assert export(FakeFetcher(), make_thread(), tmp_path) == []
+    assert os.stat(tmp_path / 'Doc.docx').st_mtime_ns == docx_mtime
+    assert not (tmp_path / 'Doc.html').exists()
+
+
+def test_updated_document_is_downloaded_again(tmp_path):
+    export(FakeFetcher(), make_thread(), tmp_path)
+
+    requests = export(FakeFetcher(), make_thread(updated_usec=2), tmp_path)
+
+    assert requests == ['https://platform.quip.test/1/threads/t1/export/docx']
+    assert json.loads((tmp_path / '.t1.meta').read_text())['updated_usec'] == 2
+
+
+def test_changed_attachment_is_downloaded_again(tmp_path):
+    export(FakeFetcher(), make_thread(), tmp_path)
+
+    requests = export(FakeFetcher(), make_thread(blob_hash='h2'), tmp_path)
+
+    assert requests == ['https://platform.quip.test/blob/1']
+
+
+def test_missing_files_are_downloaded_despite_meta(tmp_path):
+    export(FakeFetcher(), make_thread(), tmp_path)
+    os.remove(tmp_path / 'Doc.docx')
+    os.remove(tmp_path / 'Doc_attachments' / 'a.png')
+
+    assert len(export(FakeFetcher(), make_thread(), tmp_path)) == 2
+
+
+def test_failed_docx_is_retried_on_next_run(tmp_path):
+    export(FakeFetcher(status=500), make_thread(), tmp_path)
+
+    assert (tmp_path / 'Doc.html').exists()
+    assert json.loads((tmp_path / '.t1.meta').read_text())['updated_usec'] is None
+    requests = export(FakeFetcher(), make_thread(), tmp_path)
+    assert 'https://platform.quip.test/1/threads/t1/export/docx' in requests
+    assert (tmp_path / 'Doc.docx').exists()
+
+
+def test_limiter_converges_to_max_limit():
+    limiter = quip_export.AdaptiveLimiter(max_limit=8, initial_limit=2)
+    for _ in range(200):
+        limiter.increase()
+
+    assert limiter.limit == 8
+
+
+def test_limiter_never_exceeds_limit_in_flight():
+    async def run():
+        limiter = quip_export.AdaptiveLimiter(max_limit=5, initial_limit=5)
+        peak = 0
+
+        async def request():
+            nonlocal peak
+            async with limiter:
+                peak = max(peak, limiter.in_flight)
+                await asyncio.sleep(0)
+                limiter.increase()
+
+        await asyncio.gather(*[request() for _ in range(50)])
+        return peak, limiter.in_flight
+
+    assert asyncio.run(run()) == (5, 0)
+
+
+def test_limiter_halves_once_per_burst_of_429s():
+    async def run():
+        limiter = quip_export.AdaptiveLimiter(max_limit=16, initial_limit=16)
+        windows = []
+        for _ in range(4):
+            windows.append(await limiter.__aenter__())
+        for window in windows:
+            limiter.decrease(window)
+            await limiter.__aexit__(None, None, None)
+        after_burst = limiter.limit
+
+        # A 429 from a request started after the decrease counts again
+        async with limiter as window:
+            limiter.decrease(window)
+        return after_burst, limiter.limit
+
+    assert asyncio.run(run()) == (8, 4)
+
+
+def test_limiter_does_not_drop_below_one():
+    async def run():
+        limiter = quip_export.AdaptiveLimiter(max_limit=4, initial_limit=1)
+        async with limiter as window:
+            limiter.decrease(window)
+        return limiter.limit
+
+    assert asyncio.run(run()) == 1
+
+
+def test_blob_key_without_hash_or_size_changes_with_blob():
+    old = quip_export.get_blob_key({'name': 'a.png', 'url': 'https://platform.quip.test/blob/t1/b1'})
+    new = quip_export.get_blob_key({'name': 'a.png', 'url': 'https://platform.quip.test/blob/t1/b2'})
+
+    assert old != new
+
+
+def test_replaced_attachment_without_hash_is_downloaded_again(tmp_path):
+    thread = make_thread(blob_hash=None)
+    export(FakeFetcher(), thread, tmp_path)
+
+    thread['blobs'][0]['url'] = 'https://platform.quip.test/blob/2'
+    requests = export(FakeFetcher(), thread, tmp_path)
+
+    assert requests == ['https://platform.quip.test/blob/2']
+
+
+class BulkFetcher(quip_export.QuipFetcher):
+    """QuipFetcher whose bulk endpoint rejects any request naming an inaccessible ID."""
+
+    def __init__(self, inaccessible):
+        quip_export.QuipFetcher.__init__(self, quip_export.quip.QuipClient(base_url='https://platform.quip.test'),
+                                         session=None)
+        self.inaccessible = inaccessible
+        self.requests = []
+
+    async def get_json(self, path, **params):
+        ids = params['ids'].split(',')
+        self.requests.append(ids)
+        if self.inaccessible & set(ids):
+            raise quip_export.quip.QuipError(403, "Forbidden", None)
+        return {i: {'folder': {'title': i}} for i in ids}
+
+
+def test_bulk_fetch_skips_only_inaccessible_ids():
+    ids = ['f1', 'bad', 'f2', 'f3', 'f4', 'f5', 'f6', 'f7', 'f8']
+    fetcher = BulkFetcher({'bad'})
+
+    folders = asyncio.run(fetcher.get_folders(ids))
+
+    assert sorted(folders) == sorted(set(ids) - {'bad'})
+    assert ['bad'] in fetcher.requests
+
+
+class TreeFetcher(FakeFetcher):
+    """FakeFetcher that also serves a folder tree of {folder_id: (title, children)}."""
+
+    def __init__(self, tree, thread_titles):
+        FakeFetcher.__init__(self)
+        self.tree = tree
+        self.thread_titles = thread_titles
+
+    async def get_folders(self, ids):
+        await asyncio.sleep(0)
+        return {i: {'folder': {'title': self.tree[i][0]},
+                    'children': [{'thread_id': c} if c in self.thread_titles else {'folder_id': c}
+                                 for c in self.tree[i][1]]}
+                for i in ids}
+
+    async def get_threads(self, ids):
+        return {i: {'thread': {'title': self.thread_titles[i], 'updated_usec': 1}} for i in ids}
+
+
+def test_traversal_exports_whole_tree(tmp_path):
+    tree = {'root': ('Root', ['a', 't1']), 'a': ('A', ['b', 't2']), 'b': ('B', ['t3'])}
+    fetcher = TreeFetcher(tree, {'t1': 'One', 't2': 'Two', 't3': 'Three'})
+
+    asyncio.run(quip_export.process_folder_async(fetcher, 'root', str(tmp_path)))
+
+    assert (tmp_path / 'Root' / 'One.docx').exists()
+    assert (tmp_path / 'Root' / 'A' / 'Two.docx').exists()
+    assert (tmp_path / 'Root' / 'A' / 'B' / 'Three.docx').exists()
+
+
+def test_same_titled_sibling_folders_get_distinct_directories(tmp_path):
+    tree = {'root': ('Root', ['s1', 's2']), 's1': ('Sub', ['t1']), 's2': ('Sub', ['t3'])}
+    fetcher = TreeFetcher(tree, {'t1': 'Doc', 't3': 'Doc'})
+
+    asyncio.run(quip_export.process_folder_async(fetcher, 'root', str(tmp_path)))
+
+    bodies = sorted(p.read_bytes() for p in (tmp_path / 'Root').glob('*/Doc.docx'))
+    assert bodies == [b"body of " + fetcher.export_url_template.format(t).encode() for t in ('t1', 't3')]
+
+
+class FakeClock(object):
+    """Monotonic clock that only moves when the code under test sleeps."""
+
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def monotonic(self):
+        return self.now
+
+    async def sleep(self, delay):
+        self.sleeps.append(delay)
+        self.now += delay
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(quip_export.time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(quip_export.asyncio, 'sleep', clock.sleep)
+    return clock
+
+
+def test_bucket_allows_a_burst_then_waits_for_refill(clock):
+    async def run():
+        bucket = quip_export.LeakyBucket(capacity=3, refill_per_sec=2.0)
+        for _ in range(4):
+            await bucket.acquire()
+
+    asyncio.run(run())
+
+    assert clock.sleeps == [0.5]
+
+
+def test_bucket_refill_is_capped_at_capacity(clock):
+    async def run():
+        bucket = quip_export.LeakyBucket(capacity=2, refill_per_sec=1.0)
+        await bucket.acquire()
+        await bucket.acquire()
+        clock.now += 100
+        for _ in range(3):
+            await bucket.acquire()
+
+    asyncio.run(run())
+
+    assert clock.sleeps == [1.0]
+
+
+class StubSession(object):
+    """Stands in for aiohttp.ClientSession, answering GETs from a list of responses."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.urls = []
+
+    @contextlib.asynccontextmanager
+    async def get(self, url, **kwargs):
+        self.urls.append(url)
+        yield self.responses.pop(0)
+
+
+def fetch_status(responses):
+    async def run():
+        client = quip_export.quip.QuipClient(base_url='https://platform.quip.test')
+        fetcher = quip_export.QuipFetcher(client, StubSession(responses), max_concurrency=16,
+                                          rate_limit=6000)
+        async with fetcher.get('https://platform.quip.test/1/threads/t1') as response:
+            return response.status, fetcher.limiter.limit
+
+    return asyncio.run(run())
+
+
+def test_get_waits_for_retry_after_on_429(clock):
+    status, limit = fetch_status([FakeResponse(429, headers={'Retry-After': '5'}), FakeResponse(200)])
+
+    assert status == 200
+    assert clock.sleeps == [5.0]
+    # Halved from the initial 4 by the 429, then one additive step from the 200
+    assert limit == 2.5
+
+
+def test_get_backs_off_exponentially_on_gateway_errors(clock):
+    status, limit = fetch_status([FakeResponse(503), FakeResponse(502), FakeResponse(200)])
+
+    assert status == 200
+    assert clock.sleeps == [1, 2]
+    # Gateway errors neither shrink nor grow the limit
+    assert limit == quip_export.INITIAL_CONCURRENCY + 1 / quip_export.INITIAL_CONCURRENCY
+
+
+def test_get_gives_up_after_max_retries(clock):
+    responses = [FakeResponse(503) for _ in range(quip_export.MAX_RETRIES + 1)]
+
+    status, _ = fetch_status(responses)
+
+    assert status == 503
+    assert len(clock.sleeps) == quip_export.MAX_RETRIES
+
+
+def test_get_does_not_retry_client_errors(clock):
+    status, limit = fetch_status([FakeResponse(404)])
+
+    assert status == 404
+    assert clock.sleeps == []
+    assert limit == quip_export.INITIAL_CONCURRENCY
+
+
+def test_unique_names_suffix_repeats_before_the_extension():
+    names = quip_export.make_unique_names(['image.png', 'Image.png', 'image.png', 'notes'])
+
+    assert names == ['image.png', 'Image (2).png', 'image (3).png', 'notes']
+
+
+def test_duplicate_attachment_names_are_saved_separately(tmp_path):
+    thread = make_thread()
+    thread['blobs'].append({'url': 'https://platform.quip.test/blob/2', 'name': 'a.png', 'hash': 'h2'})
+
+    export(FakeFetcher(), thread, tmp_path)
+
+    attachments = tmp_path / 'Doc_attachments'
+    assert sorted(os.listdir(attachments)) == ['a (2).png', 'a.png']
+    assert (attachments / 'a (2).png').read_bytes() == b"body of https://platform.quip.test/blob/2"
+
+
+def test_thread_titles_are_unique_per_directory():
+    documents = [('t1', 'out'), ('t2', 'out'), ('t3', 'other')]
+    threads = {t: {'thread': {'title': 'Untitled'}} for t in ('t1', 't2', 't3')}
+    claimed = {}
+
+    titles = quip_export.assign_thread_titles(documents, threads, claimed)
+
+    assert titles == {('t1', 'out'): 'Untitled', ('t2', 'out'): 'Untitled (t2)',
+                      ('t3', 'other'): 'Untitled'}
+    # The same thread keeps its name when assigned again in a later batch
+    assert quip_export.assign_thread_titles([('t2', 'out')], threads, claimed) == {
+        ('t2', 'out'): 'Untitled (t2)'}
+
+
+def test_claimed_paths_are_case_insensitive_and_per_kind():
+    claimed = {}
+
+    assert quip_export.claim_output_path(claimed, 'folder', 'out/Sub', 'f1') == 'out/Sub'
+    assert quip_export.claim_output_path(claimed, 'folder', 'out/sub', 'f2') == 'out/sub (f2)'
+    assert quip_export.claim_output_path(claimed, 'document', 'out/Sub', 't1') == 'out/Sub'